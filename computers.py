@@ -1,20 +1,41 @@
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
 from PIL import Image
 import numpy as np
 
-def extract_and_print_average_values(image_path):
+Image.MAX_IMAGE_PIXELS = None
+
+def tile_means(image_path):
 
     big_image = Image.open(image_path)
 
-    image4 = big_image.crop((3*512, 0, 4*512, 512))
-    image5 = big_image.crop((4*512, 0, 5*512, 512))
+    # decode once and slice the tiles as views instead of cropping and up-casting each one
+    big_array = np.asarray(big_image)
+
+    image4_array = big_array[:512, 3*512:4*512]
+    image5_array = big_array[:512, 4*512:5*512]
+
+    average_value_image4 = image4_array.mean(dtype=np.float64)/255
+    average_value_image5 = image5_array.mean(dtype=np.float64)/255
+
+    return average_value_image4, average_value_image5
+
+def extract_and_print_average_values(image_paths):
 
-    image4_array = np.array(image4, dtype=np.float32)
-    image5_array = np.array(image5, dtype=np.float32)
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        results = list(ex.map(tile_means, image_paths, chunksize=32))
 
-    average_value_image4 = np.mean(image4_array)/255
-    average_value_image5 = np.mean(image5_array)/255
+    average_value_image4, average_value_image5 = np.mean(results, axis=0)
 
     print(f"Average of roughness: {average_value_image4}")
     print(f"Average of specular: {average_value_image5}")
 
-extract_and_print_average_values('/mnt/iusers01/fatpou01/compsci01/v67771bx/dataset/0000255_combined.png')
+if __name__ == "__main__":
+    dataset_dir = sys.argv[1] if len(sys.argv) > 1 else '/mnt/iusers01/fatpou01/compsci01/v67771bx/dataset'
+    image_paths = sorted(glob.glob(os.path.join(dataset_dir, '*_combined.png')))
+    if not image_paths:
+        sys.exit(f"No *_combined.png images found in {dataset_dir}")
+    extract_and_print_average_values(image_paths)
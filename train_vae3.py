@@ -1,6 +1,7 @@
 
 import inspect
 import argparse
+import functools
 import logging
 import math
 import os
@@ -9,16 +10,21 @@ from pathlib import Path
 
 import accelerate
 import datasets
-import numpy as np
 import torch
 import torch.nn.functional as F
+import torch._dynamo
 import torch.utils.checkpoint
 import torchvision
 import transformers
 from accelerate import Accelerator
 from accelerate.logging import get_logger
 from accelerate.state import AcceleratorState
-from accelerate.utils import ProjectConfiguration, set_seed
+from accelerate.utils import (
+    DataLoaderConfiguration,
+    DistributedDataParallelKwargs,
+    ProjectConfiguration,
+    set_seed,
+)
 from datasets import load_dataset
 from huggingface_hub import create_repo, upload_folder
 from packaging import version
@@ -41,29 +47,35 @@ if is_wandb_available():
 logger = get_logger(__name__, log_level="INFO")
 
 
-@torch.no_grad()
-def log_validation(test_dataloader, vae, accelerator, weight_dtype, epoch):
+@torch.inference_mode()
+def log_validation(test_dataloader, vae, accelerator, epoch):
     logger.info("Running validation... ")
 
     vae_model = accelerator.unwrap_model(vae)
     images = []
     for _, sample in enumerate(test_dataloader):
-        x = sample["pixel_values"].to(weight_dtype)
-        reconstructions = vae_model(x).sample
-        images.append(
-            torch.cat([sample["pixel_values"].cpu(), reconstructions.cpu()], axis=0)
-        )
+        x = sample["input"].float().sub_(127.5).div_(127.5)
+        with accelerator.autocast():
+            reconstructions = vae_model(x).sample.float()
+        # split the 12-channel reconstruction into its four 3-channel maps: [B, 12, H, W] -> [4B, 3, H, W]
+        reconstructions = reconstructions.reshape(
+            reconstructions.shape[0], 4, 3, *reconstructions.shape[2:]
+        ).flatten(0, 1)
+        images.append(torch.cat([x, reconstructions], axis=0))
+
+    # stack on the device, map [-1, 1] to [0, 1] and copy to the host once for all trackers
+    images = torch.stack(images).add_(1).div_(2).clamp_(0, 1).cpu()  # [N, 5B, 3, H, W]
+    np_images = images.flatten(0, 1).numpy()  # NCHW for add_images
 
     for tracker in accelerator.trackers:
         if tracker.name == "tensorboard":
-            np_images = np.stack([np.asarray(img) for img in images])
             tracker.writer.add_images(
-                "Original (left) / Reconstruction (right)", np_images, epoch
+                "Input, then the four reconstructed maps", np_images, epoch
             )
         elif tracker.name == "wandb":
             tracker.log(
                 {
-                    "Original (left) / Reconstruction (right)": [
+                    "Input, then the four reconstructed maps": [
                         wandb.Image(torchvision.utils.make_grid(image))
                         for _, image in enumerate(images)
                     ]
@@ -76,6 +88,44 @@ def log_validation(test_dataloader, vae, accelerator, weight_dtype, epoch):
     torch.cuda.empty_cache()
 
 
+# The dataset helpers live at module level so dataloader workers can pickle them under the
+# spawn/forkserver start methods.
+def preprocess_images(examples, image_column, train_transforms):
+    images = [image.convert("RGB") for image in examples[image_column]]
+    pixel_values = [train_transforms(image) for image in images]
+    # split each [3, 512, 2560] strip into the input tile and the four stacked maps [12, 512, 512]
+    examples["input"] = [t[:, :, :512] for t in pixel_values]
+    # [3, 512, 2048] -> [3, 512, 4, 512] -> [4, 3, 512, 512] -> [12, 512, 512]
+    examples["target"] = [
+        t[:, :, 512:].unflatten(-1, (4, 512)).permute(2, 0, 1, 3).reshape(12, 512, 512)
+        for t in pixel_values
+    ]
+    return examples
+
+
+def collate_fn(examples):
+    input_values = torch.stack([example["input"] for example in examples])
+    input_values = input_values.to(memory_format=torch.contiguous_format)
+    target_values = torch.stack([example["target"] for example in examples])
+    target_values = target_values.to(memory_format=torch.contiguous_format)
+    return {"input": input_values, "target": target_values}
+
+
+class VAEReconstruction(nn.Module):
+    # Runs encode/decode inside forward so the prepared (DDP-wrapped) module sees every training
+    # step and all-reduces the gradients. Returns the per-sample KL term and the prediction.
+    def __init__(self, vae):
+        super().__init__()
+        self.vae = vae
+
+    def forward(self, input_image):
+        posterior = self.vae.encode(input_image).latent_dist
+        pred = self.vae.decode(posterior.mode()).sample
+        # KL in fp32
+        kl = type(posterior)(posterior.parameters.float()).kl()
+        return kl, pred
+
+
 def parse_args():
     parser = argparse.ArgumentParser(
         description="Simple example of a VAE training script."
@@ -177,6 +227,14 @@ def parse_args():
         action="store_true",
         help="Whether or not to use gradient checkpointing to save memory at the expense of slower backward pass.",
     )
+    parser.add_argument(
+        "--dataloader_num_workers",
+        type=int,
+        default=min(8, os.cpu_count() or 1),
+        help=(
+            "Number of subprocesses to use for data loading. 0 means that the data will be loaded in the main process."
+        ),
+    )
     parser.add_argument(
         "--learning_rate",
         type=float,
@@ -233,7 +291,9 @@ def parse_args():
         help=(
             "Whether to use mixed precision. Choose between fp16 and bf16 (bfloat16). Bf16 requires PyTorch >="
             " 1.10.and an Nvidia Ampere GPU.  Default to the value of accelerate config of the current system or the"
-            " flag passed with the `accelerate.launch` command. Use this argument to override the accelerate config."
+            " flag passed with the `accelerate.launch` command, or bf16 if neither sets one and the GPU has native bf16"
+            " support (Ampere or newer)."
+            " Use this argument to override the accelerate config."
         ),
     )
     parser.add_argument(
@@ -318,6 +378,22 @@ def main():
 
     logging_dir = os.path.join(args.output_dir, args.logging_dir)
 
+    # Enable TF32 for faster training on Ampere GPUs,
+    # cf https://pytorch.org/docs/stable/notes/cuda.html#tensorfloat-32-tf32-on-ampere-devices
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
+
+    # Default to bf16 on Ampere or newer, unless `accelerate launch` (flag or config) already picked
+    # a mode. Older GPUs only emulate bf16, which is slower than fp32, so is_bf16_supported() is not
+    # used here. Pass `--mixed_precision no` to train in fp32.
+    if (
+        args.mixed_precision is None
+        and "ACCELERATE_MIXED_PRECISION" not in os.environ
+        and torch.cuda.is_available()
+        and torch.cuda.get_device_capability()[0] >= 8
+    ):
+        args.mixed_precision = "bf16"
+
     accelerator_project_config = ProjectConfiguration(
         total_limit=args.checkpoints_total_limit,
         project_dir=args.output_dir,
@@ -329,6 +405,10 @@ def main():
         mixed_precision=args.mixed_precision,
         log_with=args.report_to,
         project_config=accelerator_project_config,
+        # copy the pinned uint8 batches to the device asynchronously
+        dataloader_config=DataLoaderConfiguration(non_blocking=True),
+        # copied_mid_block3/4 run only their first resnet, the second one gets no gradient
+        kwargs_handlers=[DistributedDataParallelKwargs(find_unused_parameters=True)],
     )
 
     # Make one log on every process with the configuration for debugging.
@@ -355,8 +435,30 @@ def main():
 
     copied_mid_block1 = deepcopy(vae.decoder.mid_block)
     copied_mid_block2 = deepcopy(vae.decoder.mid_block)
-    copied_mid_block3 = deepcopy(vae.decoder.mid_block)
-    copied_mid_block4 = deepcopy(vae.decoder.mid_block)
+    numc=128
+
+    # blocks 3/4 run at numc channels without attention, so build them fresh instead of
+    # deep-copying the 512-channel mid block and replacing all of its layers. Use the loaded
+    # mid block's class so this does not depend on where diffusers keeps UNetMidBlock2D.
+    UNetMidBlock2D = type(vae.decoder.mid_block)
+    copied_mid_block3 = UNetMidBlock2D(
+        in_channels=numc,
+        temb_channels=None,
+        num_layers=len(vae.decoder.mid_block.resnets) - 1,
+        resnet_eps=1e-6,
+        resnet_act_fn=vae.config.act_fn,
+        resnet_groups=vae.config.norm_num_groups,
+        add_attention=False,
+    )
+    copied_mid_block4 = UNetMidBlock2D(
+        in_channels=numc,
+        temb_channels=None,
+        num_layers=len(vae.decoder.mid_block.resnets) - 1,
+        resnet_eps=1e-6,
+        resnet_act_fn=vae.config.act_fn,
+        resnet_groups=vae.config.norm_num_groups,
+        add_attention=False,
+    )
     vae.decoder.copied_mid_block1 = copied_mid_block1
     vae.decoder.copied_mid_block2 = copied_mid_block2
     vae.decoder.copied_mid_block3 = copied_mid_block3
@@ -370,8 +472,6 @@ def main():
     # adjust_conv_layer = nn.Conv2d(128, 32, kernel_size=1, stride=1, padding=0)
     # vae.decoder.adjust_conv_layer = adjust_conv_layer
  
-    numc=128
-
     # for attn in vae.decoder.copied_mid_block4.attentions:
     #     attn.to_q = nn.Linear(numc, numc, bias=True)
     #     attn.to_k = nn.Linear(numc, numc, bias=True)
@@ -380,18 +480,7 @@ def main():
    
 
 
-    for resnet_block in vae.decoder.copied_mid_block3.resnets:
-        resnet_block.norm1 = nn.GroupNorm(32, numc, eps=1e-06, affine=True)
-        resnet_block.conv1 = nn.Conv2d(numc, numc, kernel_size=(3, 3), stride=(1, 1), padding=(1, 1))
-        resnet_block.norm2 = nn.GroupNorm(32, numc, eps=1e-06, affine=True)
-        resnet_block.conv2 = nn.Conv2d(numc, numc, kernel_size=(3, 3), stride=(1, 1), padding=(1, 1))
-    for resnet_block in vae.decoder.copied_mid_block4.resnets:
-        resnet_block.norm1 = nn.GroupNorm(32, numc, eps=1e-06, affine=True)
-        resnet_block.conv1 = nn.Conv2d(numc, numc, kernel_size=(3, 3), stride=(1, 1), padding=(1, 1))
-        resnet_block.norm2 = nn.GroupNorm(32, numc, eps=1e-06, affine=True)
-        resnet_block.conv2 = nn.Conv2d(numc, numc, kernel_size=(3, 3), stride=(1, 1), padding=(1, 1))
-
-
+    # empty attentions keep the original behaviour of running only the first resnet
     copied_mid_block3.attentions = nn.ModuleList()
     copied_mid_block4.attentions = nn.ModuleList()
     # for attention_module in vae.decoder.copied_mid_block4.attentions:
@@ -410,6 +499,8 @@ def main():
 
         sample = self.conv_in(sample)
 
+        # the up blocks and copied_mid_block3/4 share a dtype, so a single cast after the
+        # middle blocks is enough
         upscale_dtype = next(iter(self.up_blocks.parameters())).dtype
         if self.training and self.gradient_checkpointing:
 
@@ -421,25 +512,10 @@ def main():
 
             # if is_torch_version(">=", "1.11.0"):
             if True:
-                # middle
-                sample = torch.utils.checkpoint.checkpoint(
-                    create_custom_forward(self.mid_block),
-                    sample,
-                    latent_embeds,
-                    use_reentrant=False,
-                )
-                sample = torch.utils.checkpoint.checkpoint(
-                    create_custom_forward(self.copied_mid_block1),
-                    sample,
-                    latent_embeds,
-                    use_reentrant=False,
-                )
-                sample = torch.utils.checkpoint.checkpoint(
-                    create_custom_forward(self.copied_mid_block2),
-                    sample,
-                    latent_embeds,
-                    use_reentrant=False,
-                )
+                # middle, at latent resolution the activations are cheap to keep
+                sample = self.mid_block(sample, latent_embeds)
+                sample = self.copied_mid_block1(sample, latent_embeds)
+                sample = self.copied_mid_block2(sample, latent_embeds)
                 sample = sample.to(upscale_dtype)
 
                 # up
@@ -453,11 +529,19 @@ def main():
                     
                 # sample=adjust_conv_layer(sample)
 
-                sample = self.copied_mid_block3(sample, latent_embeds)
-
-                sample = self.copied_mid_block4(sample, latent_embeds)
-
-                sample = sample.to(upscale_dtype)
+                # full resolution blocks dominate activation memory, recompute them in backward
+                sample = torch.utils.checkpoint.checkpoint(
+                    create_custom_forward(self.copied_mid_block3),
+                    sample,
+                    latent_embeds,
+                    use_reentrant=False,
+                )
+                sample = torch.utils.checkpoint.checkpoint(
+                    create_custom_forward(self.copied_mid_block4),
+                    sample,
+                    latent_embeds,
+                    use_reentrant=False,
+                )
                 # sample=adjust_conv_layer2(sample)
             else:
                 # middle
@@ -490,7 +574,6 @@ def main():
             # sample=adjust_conv_layer(sample)
             sample = self.copied_mid_block3(sample, latent_embeds)
             sample = self.copied_mid_block4(sample, latent_embeds)
-            sample = sample.to(upscale_dtype)
             # sample=adjust_conv_layer2(sample)
 
 
@@ -520,8 +603,9 @@ def main():
         for param in vae.encoder.parameters():
             param.requires_grad = False
 
-    print(vae)
-    print(inspect.getsource(vae.decoder.mid_block.forward))
+    if accelerator.is_main_process:
+        print(vae)
+        print(inspect.getsource(vae.decoder.mid_block.forward))
 
 
     if args.gradient_checkpointing:
@@ -535,7 +619,16 @@ def main():
             * accelerator.num_processes
         )
 
-    optimizer = torch.optim.AdamW(vae_params, lr=args.learning_rate)
+    # The fused kernel checks the parameter device at construction, so place the vae first.
+    # NHWC for the conv/GroupNorm heavy decoder, set before prepare so DDP buckets match the
+    # parameter strides; the replaced conv_out is converted along with it.
+    vae.to(accelerator.device, memory_format=torch.channels_last)
+    vae_params = list(vae_params)
+    try:
+        optimizer = torch.optim.AdamW(vae_params, lr=args.learning_rate, fused=True)
+    except (TypeError, RuntimeError):
+        # older PyTorch or a non-CUDA device
+        optimizer = torch.optim.AdamW(vae_params, lr=args.learning_rate, foreach=True)
 
     # Get the datasets: you can either provide your own training and evaluation files (see below)
     # or specify a Dataset from the hub (the dataset will be downloaded automatically from the datasets Hub).
@@ -575,15 +668,14 @@ def main():
                 (512, 2560), interpolation=transforms.InterpolationMode.BILINEAR
             ),
             # transforms.RandomCrop(args.resolution),
-            transforms.ToTensor(),
-            transforms.Normalize([0.5], [0.5]),
+            # kept as uint8, normalized to [-1, 1] on the device in the training step
+            transforms.PILToTensor(),
         ]
     )
 
-    def preprocess(examples):
-        images = [image.convert("RGB") for image in examples[image_column]]
-        examples["pixel_values"] = [train_transforms(image) for image in images]
-        return examples
+    preprocess = functools.partial(
+        preprocess_images, image_column=image_column, train_transforms=train_transforms
+    )
 
     with accelerator.main_process_first():
         # Split into train/test
@@ -592,21 +684,22 @@ def main():
         train_dataset = dataset["train"].with_transform(preprocess)
         test_dataset = dataset["test"].with_transform(preprocess)
 
-    def collate_fn(examples):
-        pixel_values = torch.stack([example["pixel_values"] for example in examples])
-        pixel_values = pixel_values.to(memory_format=torch.contiguous_format).float()
-        return {"pixel_values": pixel_values}
-
     # DataLoaders creation:
+    dataloader_kwargs = {"num_workers": args.dataloader_num_workers, "pin_memory": True}
+    if args.dataloader_num_workers > 0:
+        dataloader_kwargs.update(persistent_workers=True, prefetch_factor=4)
+
     train_dataloader = torch.utils.data.DataLoader(
         train_dataset,
         shuffle=True,
         collate_fn=collate_fn,
         batch_size=args.train_batch_size,
+        drop_last=True,
+        **dataloader_kwargs,
     )
 
     test_dataloader = torch.utils.data.DataLoader(
-        test_dataset, shuffle=True, collate_fn=collate_fn
+        test_dataset, shuffle=True, collate_fn=collate_fn, **dataloader_kwargs
     )
 
     # for step, batch in enumerate(train_dataloader):
@@ -639,24 +732,47 @@ def main():
 
     )
 
-    # Prepare everything with our `accelerator`.
+    # Prepare everything with our `accelerator`. The training step goes through the prepared
+    # module's forward, `vae` stays the plain AutoencoderKL for compiling, validation and saving.
+    # Its weights stay in fp32, mixed precision comes from running it under accelerator.autocast().
     (
-        vae,
+        vae_reconstruction,
         optimizer,
         train_dataloader,
         test_dataloader,
         lr_scheduler,
     ) = accelerator.prepare(
-        vae, optimizer, train_dataloader, test_dataloader, lr_scheduler
+        VAEReconstruction(vae), optimizer, train_dataloader, test_dataloader, lr_scheduler
     )
 
-    weight_dtype = torch.float32
-    if accelerator.mixed_precision == "fp16":
-        weight_dtype = torch.float16
-    elif accelerator.mixed_precision == "bf16":
-        weight_dtype = torch.bfloat16
-
-    vae.to(accelerator.device, dtype=weight_dtype)
+    # Compile the patched decoder forward in place so the state dict keys stay unchanged for
+    # save_state/save_pretrained. Latents are fixed-shape, so compile statically.
+    decoder = vae.decoder
+    eager_forward = decoder.forward
+    warmup_image = warmup_pred = None
+    try:
+        decoder.forward = torch.compile(
+            eager_forward, mode="reduce-overhead", dynamic=False
+        )
+        # torch.compile is lazy, run one forward/backward on a dummy batch so Inductor/Triton
+        # failures surface here instead of inside the training loop
+        vae.train()
+        warmup_image = torch.zeros(
+            args.train_batch_size, 3, 512, 512, device=accelerator.device
+        ).to(memory_format=torch.channels_last)
+        with accelerator.autocast():
+            warmup_pred = vae.decode(vae.encode(warmup_image).latent_dist.mode()).sample
+        warmup_pred.float().mean().backward()
+    except torch.cuda.OutOfMemoryError:
+        # not a compile problem, eager mode at the same batch size would not fit either
+        raise
+    except (torch._dynamo.exc.BackendCompilerFailed, ImportError, RuntimeError) as e:
+        decoder.forward = eager_forward
+        logger.warning(f"Compiling the decoder failed, running it in eager mode: {e}")
+    finally:
+        # drop the warm-up batch, the CUDA-graph output and the grads it produced
+        del warmup_image, warmup_pred
+        optimizer.zero_grad(set_to_none=True)
 
     # We need to initialize the trackers we use, and also store our configuration.
     # The trackers initializes automatically on the main process.
@@ -722,73 +838,84 @@ def main():
     )
     progress_bar.set_description("Steps")
 
-    lpips_loss_fn = lpips.LPIPS(net="alex").to(accelerator.device)
+    lpips_loss_fn = lpips.LPIPS(net="alex").to(accelerator.device).eval()
+    lpips_loss_fn.requires_grad_(False)
+    lpips_loss_fn.to(memory_format=torch.channels_last)
+    # LPIPS runs under bf16 autocast when training in bf16, in fp32 otherwise
+    lpips_bf16 = accelerator.mixed_precision == "bf16"
 
     for epoch in range(first_epoch, args.num_train_epochs):
-        vae.train()
-        train_loss = 0.0
+        vae_reconstruction.train()
+        train_loss = torch.zeros((), device=accelerator.device)
         for step, batch in enumerate(train_dataloader):
-            with accelerator.accumulate(vae):
-                datafile = batch["pixel_values"].to(weight_dtype)
-                print("shape",datafile.shape)
-                input_image = datafile[:,:, :, :512]  # Shape will be [3, 288, 288]
-                # stacked_image = datafile[:,:, 512:, :]  # Shape will be [3, 288, 1152]
-                # print("shape",stacked_image.shape)
-                # target = stacked_image.view(12, 512, 512)
-
-           
-
-
-                images = torch.chunk(datafile, 5, dim=3)  
+            with accelerator.accumulate(vae_reconstruction):
+                input_image = batch["input"].float().sub_(127.5).div_(127.5)  # [B, 3, 512, 512]
+                target = batch["target"].float().sub_(127.5).div_(127.5)  # [B, 12, 512, 512]
 
+                input_image = input_image.to(memory_format=torch.channels_last)
+                target = target.to(memory_format=torch.channels_last)
 
-                target = torch.cat([img.squeeze(0) for img in images[1:]], dim=0)  #  [12, 512, 512]
-                target = target.unsqueeze(0)
+                if step == 0 and accelerator.is_main_process:
+                    logger.info(f"input shape {input_image.shape}, target shape {target.shape}")
 
+                with accelerator.autocast():
+                    kl, pred = vae_reconstruction(input_image)
 
-                print("target shape",target.shape)
+                # compute the losses in fp32
+                pred = pred.float()
 
-                posterior = vae.module.encode(input_image).latent_dist
-                z = posterior.mode()
-                pred = vae.module.decode(z).sample
-                print("pred shape",pred.shape)
-
-                kl_loss = posterior.kl().mean()
+                kl_loss = kl.mean()
                 mse_loss = F.mse_loss(pred, target, reduction="mean")
-                total_lpips_loss = 0.0
-                for i in range(4):
-
-                    start_channel = i * 3
-                    end_channel = (i + 1) * 3
-
-
-                    pred_channel = pred[:, start_channel:end_channel]
-                    target_channel = target[:, start_channel:end_channel]
+                # score the four 3-channel maps in one LPIPS pass: [B, 12, H, W] -> [4B, 3, H, W]
+                pred4 = pred.reshape(pred.shape[0], 4, 3, *pred.shape[2:]).flatten(0, 1)
+                target4 = target.reshape(target.shape[0], 4, 3, *target.shape[2:]).flatten(0, 1)
 
-
-                    loss = lpips_loss_fn(pred_channel, target_channel).mean()
-                    total_lpips_loss += loss
-                lpips_loss = total_lpips_loss/4
+                pred4 = pred4.to(memory_format=torch.channels_last)
+                target4 = target4.to(memory_format=torch.channels_last)
+                with torch.autocast(
+                    accelerator.device.type, dtype=torch.bfloat16, enabled=lpips_bf16
+                ):
+                    lpips_loss = lpips_loss_fn(pred4, target4).mean()
 
                 loss = (
                     mse_loss + args.lpips_scale * lpips_loss + args.kl_scale * kl_loss
                 )
 
-                # Gather the losses across all processes for logging (if we use distributed training).
-                avg_loss = accelerator.gather(loss.repeat(args.train_batch_size)).mean()
-                train_loss += avg_loss.item() / args.gradient_accumulation_steps
+                # Accumulate locally, the losses are gathered across processes once per optimizer step.
+                train_loss += loss.detach() / args.gradient_accumulation_steps
 
                 accelerator.backward(loss)
                 optimizer.step()
                 lr_scheduler.step()
-                optimizer.zero_grad()
+                optimizer.zero_grad(set_to_none=True)
 
             # Checks if the accelerator has performed an optimization step behind the scenes
             if accelerator.sync_gradients:
                 progress_bar.update(1)
                 global_step += 1
-                accelerator.log({"train_loss": train_loss}, step=global_step)
-                train_loss = 0.0
+                avg_loss = accelerator.gather(train_loss).mean()
+                # copy all logged values to the host in one transfer, once per optimizer step
+                avg_loss, step_loss, mse, lpips_value, kl = torch.stack(
+                    [
+                        avg_loss,
+                        loss.detach(),
+                        mse_loss.detach(),
+                        lpips_loss.detach(),
+                        kl_loss.detach(),
+                    ]
+                ).tolist()
+                train_loss = torch.zeros((), device=accelerator.device)
+
+                logs = {
+                    "train_loss": avg_loss,
+                    "step_loss": step_loss,
+                    "lr": lr_scheduler.get_last_lr()[0],
+                    "mse": mse,
+                    "lpips": lpips_value,
+                    "kl": kl,
+                }
+                accelerator.log(logs, step=global_step)
+                progress_bar.set_postfix(**logs)
 
                 if global_step % args.checkpointing_steps == 0:
                     if accelerator.is_main_process:
@@ -798,25 +925,14 @@ def main():
                         accelerator.save_state(save_path)
                         logger.info(f"Saved state to {save_path}")
 
-            logs = {
-                "step_loss": loss.detach().item(),
-                "lr": lr_scheduler.get_last_lr()[0],
-                "mse": mse_loss.detach().item(),
-                "lpips": lpips_loss.detach().item(),
-                "kl": kl_loss.detach().item(),
-            }
-            accelerator.log(logs)
-            progress_bar.set_postfix(**logs)
-
         # if accelerator.is_main_process:
         #     if epoch % args.validation_epochs == 0:
         #         with torch.no_grad():
-        #             log_validation(test_dataloader, vae, accelerator, weight_dtype, epoch)
+        #             log_validation(test_dataloader, vae, accelerator, epoch)
 
     # Create the pipeline using the trained modules and save it.
     accelerator.wait_for_everyone()
     if accelerator.is_main_process:
-        vae = accelerator.unwrap_model(vae)
         vae.save_pretrained(args.output_dir)
 
     accelerator.end_training()